@@ -10,9 +10,11 @@ Changes in v4:
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
-import os, json, time, threading, queue, re, csv, sys
+import os, json, time, threading, queue, re, csv, sys, gzip, hashlib, random
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import html as html_mod
 
 import requests
@@ -25,6 +27,36 @@ try:
 except ImportError:
     keyring = None
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp", ".webp")
+# Pillow modes that convert to 8-bit RGB without losing the picture; 16-bit modes are rescaled first
+RGB_SAFE_MODES = ("1", "P", "PA", "LA", "RGBA", "RGBX", "CMYK", "YCbCr")
+SIXTEEN_BIT_MODES = ("I;16", "I;16B", "I;16L", "I;16N", "I")
+
+def _make_derivative(src, dst, max_px, quality):
+    """Worker-process job: fit `src` within max_px, drop EXIF/XMP/ICC and save as JPEG to `dst`."""
+    Image.MAX_IMAGE_PIXELS = None  # Archival scans routinely exceed Pillow's decompression-bomb limit
+    with Image.open(src) as im:
+        im.draft("RGB", (max_px, max_px))  # Lets the JPEG decoder downscale while reading
+        im = ImageOps.exif_transpose(im)
+        if im.mode in SIXTEEN_BIT_MODES:
+            # A plain convert() clips 16-bit samples to 255 (an almost white image); scale them to 8 bits
+            im = im.convert("I").point(lambda v: v / 256).convert("L")
+        elif im.mode in RGB_SAFE_MODES:
+            im = im.convert("RGB")
+        elif im.mode not in ("RGB", "L"):
+            # e.g. float or signed-16 scans: no safe 8-bit mapping, so Omeka gets the original URL
+            raise ValueError(f"unsupported image mode {im.mode}")
+        im.thumbnail((max_px, max_px), Image.LANCZOS)
+        tmp = f"{dst}.{os.getpid()}.part"  # Two URLs with the same content may derive at once
+        im.save(tmp, "JPEG", quality=quality, optimize=True, progressive=True)
+    os.replace(tmp, dst)
+    return os.path.getsize(src), os.path.getsize(dst)
+
 class MaracasProV4:
     # ---------------------------- Init ----------------------------
     def __init__(self, root):
@@ -35,9 +67,13 @@ class MaracasProV4:
         # State
         self._log_q = queue.Queue()
         self.cancel_requested = False
+        self._running = None  # Name of the upload/replay/verify/watch run in progress, see _claim_run()
         self.input_csv_file = None
         self.csv_format = None
         self.stats = {"upload_success": 0, "upload_failed": 0}
+        self._warned = set()
+        self._quota = None  # Per-run schedule/budget state, see _start_schedule()
+        self._derivatives = {}  # Image URL -> local access derivative for the current batch
 
         # Config/state variables
         self.setup_configuration()
@@ -72,8 +108,33 @@ class MaracasProV4:
         # Upload options
         self.upload_limit = tk.IntVar(value=0)
         self.req_delay_ms = tk.IntVar(value=100)
+        # Two-lane scheduler: metadata-only rows and file-bearing rows get separate worker pools
+        self.upload_workers = tk.IntVar(value=4)
+        self.file_workers = tk.IntVar(value=2)
+        self.defer_file_attach = tk.BooleanVar(value=False)  # Create item first, attach file_urls afterwards
+        self.link_relations = tk.BooleanVar(value=False)  # Rewrite Relation → Identifier references to item URLs
         self.csv_delimiter = tk.StringVar(value="Auto")
         
+        # Client-side image derivatives (needs Pillow)
+        self.optimize_images = tk.BooleanVar(value=False)
+        self.image_max_px = tk.IntVar(value=3000)
+        self.image_quality = tk.IntVar(value=85)
+
+        # Post-upload read-back verification
+        self.verify_after_upload = tk.BooleanVar(value=False)
+        self.verify_sample_pct = tk.IntVar(value=100)  # % of created items to read back
+
+        # Scheduled windows & hourly budgets (0 = unlimited), e.g. "22:00-06:00, 12:00-13:00"
+        self.schedule_enabled = tk.BooleanVar(value=False)
+        self.schedule_windows = tk.StringVar(value="22:00-06:00")
+        self.items_per_hour = tk.IntVar(value=0)
+        self.mb_per_hour = tk.IntVar(value=0)
+
+        # Watch-folder mode: CSVs dropped here are uploaded and moved to done/ or failed/
+        self.watch_dir = tk.StringVar(value="")
+        self.watch_interval_s = 5
+        self.watching = False
+
         # Language preference for strict CSVs
         self.target_lang_pref = tk.StringVar(value="english") # 'spanish' or 'english'
 
@@ -86,9 +147,10 @@ class MaracasProV4:
         retry_strategy = Retry(
             total=3, backoff_factor=0.5,
             status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "OPTIONS", "POST"]
+            allowed_methods=["HEAD", "GET", "OPTIONS", "POST", "PUT"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        # Pool sized for the concurrent replayer so workers don't wait on connections
+        adapter = HTTPAdapter(max_retries=retry_strategy, pool_connections=4, pool_maxsize=32)
         s.mount("http://", adapter); s.mount("https://", adapter)
         s.headers.update({"User-Agent": "MARACAS-Pro/4.0", "Accept": "application/json"})
         return s
@@ -180,6 +242,16 @@ class MaracasProV4:
         self.upload_file_label = tk.Label(row, text="No file selected", bg="#f8fafc", fg="#718096"); self.upload_file_label.pack(side="left")
         tk.Button(row, text="📂 Browse CSV", bg="#4299e1", fg="white", command=self.browse_upload_file).pack(side="left", padx=10)
 
+        # Watch folder
+        watch_group = tk.LabelFrame(tab, text="Watch Folder (Continuous Ingestion)", font=("Arial", 12, "bold"), bg="#f8fafc", fg="#1a365d")
+        watch_group.pack(fill=tk.X, padx=20, pady=6)
+        wrow = tk.Frame(watch_group, bg="#f8fafc"); wrow.pack(fill=tk.X, padx=15, pady=8)
+        tk.Entry(wrow, textvariable=self.watch_dir, width=60).pack(side="left")
+        tk.Button(wrow, text="Browse", command=self.browse_watch_directory, bg="#ed8936", fg="white").pack(side="left", padx=10)
+        self.watch_btn = tk.Button(wrow, text="👁️ Start Watching", command=self.toggle_watch_folder, bg="#319795", fg="white")
+        self.watch_btn.pack(side="left")
+        self.watch_status = tk.Label(wrow, text="Not watching", bg="#f8fafc", fg="#718096"); self.watch_status.pack(side="left", padx=10)
+
         # Options
         opt_group = tk.LabelFrame(tab, text="Upload Options", font=("Arial", 12, "bold"), bg="#f8fafc", fg="#1a365d")
         opt_group.pack(fill=tk.X, padx=20, pady=6)
@@ -195,10 +267,39 @@ class MaracasProV4:
         orow2 = tk.Frame(opt_group, bg="#f8fafc"); orow2.pack(fill=tk.X, padx=15, pady=6)
         tk.Checkbutton(orow2, text="Render HTML values", variable=self.render_html_values, bg="#f8fafc").pack(side="left")
         tk.Checkbutton(orow2, text="Make items public", variable=self.items_public, bg="#f8fafc").pack(side="left", padx=15)
-        tk.Checkbutton(orow2, text="Dry-run (Log only)", variable=self.dry_run, bg="#f8fafc").pack(side="left", padx=15)
+        tk.Checkbutton(orow2, text="Dry-run (Compile to NDJSON)", variable=self.dry_run, bg="#f8fafc").pack(side="left", padx=15)
         tk.Label(orow2, text="Limit:", bg="#f8fafc").pack(side="left", padx=(20,5))
         tk.Entry(orow2, textvariable=self.upload_limit, width=6).pack(side="left")
 
+        orow3 = tk.Frame(opt_group, bg="#f8fafc"); orow3.pack(fill=tk.X, padx=15, pady=6)
+        tk.Label(orow3, text="Metadata workers:", bg="#f8fafc").pack(side="left", padx=(0,5))
+        tk.Entry(orow3, textvariable=self.upload_workers, width=4).pack(side="left")
+        tk.Label(orow3, text="File workers:", bg="#f8fafc").pack(side="left", padx=(20,5))
+        tk.Entry(orow3, textvariable=self.file_workers, width=4).pack(side="left")
+        tk.Checkbutton(orow3, text="Attach files after create", variable=self.defer_file_attach, bg="#f8fafc").pack(side="left", padx=15)
+        tk.Checkbutton(orow3, text="Link Relation → Identifier rows", variable=self.link_relations, bg="#f8fafc").pack(side="left", padx=15)
+
+        orow4 = tk.Frame(opt_group, bg="#f8fafc"); orow4.pack(fill=tk.X, padx=15, pady=6)
+        tk.Checkbutton(orow4, text="Only upload in windows:", variable=self.schedule_enabled, bg="#f8fafc").pack(side="left")
+        tk.Entry(orow4, textvariable=self.schedule_windows, width=28).pack(side="left", padx=5)
+        tk.Label(orow4, text="Items/hour:", bg="#f8fafc").pack(side="left", padx=(20,5))
+        tk.Entry(orow4, textvariable=self.items_per_hour, width=7).pack(side="left")
+        tk.Label(orow4, text="MB/hour:", bg="#f8fafc").pack(side="left", padx=(20,5))
+        tk.Entry(orow4, textvariable=self.mb_per_hour, width=7).pack(side="left")
+        tk.Label(orow4, text="(0 = unlimited)", bg="#f8fafc", fg="#718096").pack(side="left", padx=5)
+
+        orow5 = tk.Frame(opt_group, bg="#f8fafc"); orow5.pack(fill=tk.X, padx=15, pady=6)
+        tk.Checkbutton(orow5, text="Optimize images before upload", variable=self.optimize_images, bg="#f8fafc").pack(side="left")
+        tk.Label(orow5, text="Max size (px):", bg="#f8fafc").pack(side="left", padx=(20,5))
+        tk.Entry(orow5, textvariable=self.image_max_px, width=6).pack(side="left")
+        tk.Label(orow5, text="JPEG quality:", bg="#f8fafc").pack(side="left", padx=(20,5))
+        tk.Entry(orow5, textvariable=self.image_quality, width=4).pack(side="left")
+        if Image is None:
+            tk.Label(orow5, text="(install Pillow to enable)", bg="#f8fafc", fg="#e53e3e").pack(side="left", padx=10)
+        tk.Checkbutton(orow5, text="Verify after upload", variable=self.verify_after_upload, bg="#f8fafc").pack(side="left", padx=(30,0))
+        tk.Label(orow5, text="Sample %:", bg="#f8fafc").pack(side="left", padx=(10,5))
+        tk.Entry(orow5, textvariable=self.verify_sample_pct, width=4).pack(side="left")
+
         # Controls
         ctrl = tk.Frame(tab, bg="#f8fafc"); ctrl.pack(fill=tk.X, padx=20, pady=12)
         self.upload_btn = tk.Button(ctrl, text="📤 Start Upload", command=self.start_upload,
@@ -206,6 +307,10 @@ class MaracasProV4:
         self.cancel_btn = tk.Button(ctrl, text="✋ Cancel", command=self.request_cancel, state="disabled"); self.cancel_btn.pack(side="left", padx=10)
         tk.Button(ctrl, text="🧪 Test Single Row", command=self.test_single_upload,
                   bg="#d69e2e", fg="white", font=("Arial", 11, "bold"), padx=14, pady=6).pack(side="left", padx=12)
+        tk.Button(ctrl, text="♻️ Replay NDJSON", command=self.replay_payload_file,
+                  bg="#319795", fg="white", font=("Arial", 11, "bold"), padx=14, pady=6).pack(side="left", padx=12)
+        tk.Button(ctrl, text="🔍 Verify Manifest", command=self.verify_manifest_file,
+                  bg="#805ad5", fg="white", font=("Arial", 11, "bold"), padx=14, pady=6).pack(side="left", padx=12)
         tk.Button(ctrl, text="🧹 Clear Log", command=self.clear_upload_log,
                   bg="#718096", fg="white", font=("Arial", 10, "bold")).pack(side="left", padx=12)
 
@@ -219,6 +324,7 @@ class MaracasProV4:
         self.upload_total_label.pack(side="left", padx=10)
         self.upload_success_label.pack(side="left", padx=10)
         self.upload_failed_label.pack(side="left", padx=10)
+        self.eta_label = tk.Label(srow, text="", bg="#f8fafc", fg="#4a5568"); self.eta_label.pack(side="right", padx=10)
         self.upload_progress = ttk.Progressbar(prog, mode="determinate"); self.upload_progress.pack(fill=tk.X, padx=15, pady=(0,10))
         self.upload_log = scrolledtext.ScrolledText(prog, height=16, font=("Consolas", 9),
                                                     bg="#1a202c", fg="#e2e8f0", insertbackground="white")
@@ -244,6 +350,11 @@ class MaracasProV4:
         self.root.after(60, self._drain_log_queue)
 
     def enqueue_log(self, message): self._log_q.put(message)
+    def _warn_once(self, message):
+        # Per-row warnings repeat identically for every row; only log the first per batch
+        if message in self._warned: return
+        self._warned.add(message)
+        self.enqueue_log(message)
     def _ui(self, fn, *args, **kwargs): 
         # Safely capture args/kwargs for thread-safe UI updates
         self.root.after(0, lambda f=fn, a=args, k=kwargs: f(*a, **k))
@@ -253,7 +364,14 @@ class MaracasProV4:
         try:
             settings = {
                 "output_dir": self.output_dir_var.get(),
-                "api_url": self.omeka_api_url.get().strip()
+                "api_url": self.omeka_api_url.get().strip(),
+                "watch_dir": self.watch_dir.get().strip(),
+                "schedule": {
+                    "enabled": self.schedule_enabled.get(),
+                    "windows": self.schedule_windows.get().strip(),
+                    "items_per_hour": self.items_per_hour.get(),
+                    "mb_per_hour": self.mb_per_hour.get()
+                }
             }
             Path(".maracas_pro_settings.json").write_text(json.dumps(settings, indent=2), encoding="utf-8")
             self.save_api_key_if_opted()
@@ -270,6 +388,14 @@ class MaracasProV4:
                     self.output_dir = data["output_dir"]; self.output_dir_var.set(self.output_dir)
                 if data.get("api_url"):
                     self.omeka_api_url.set(data["api_url"])
+                if data.get("watch_dir"):
+                    self.watch_dir.set(data["watch_dir"])
+                sched = data.get("schedule") or {}
+                if sched:
+                    self.schedule_enabled.set(bool(sched.get("enabled")))
+                    self.schedule_windows.set(sched.get("windows") or self.schedule_windows.get())
+                    self.items_per_hour.set(int(sched.get("items_per_hour") or 0))
+                    self.mb_per_hour.set(int(sched.get("mb_per_hour") or 0))
         except Exception: pass
 
     def load_saved_key(self):
@@ -516,9 +642,10 @@ class MaracasProV4:
             return csv.Sniffer().sniff(sample).delimiter
         except: return ","
 
-    def _read_csv(self):
-        sep = self._detect_delimiter(self.input_csv_file)
-        df = pd.read_csv(self.input_csv_file, dtype=str, sep=sep).fillna("")
+    def _read_csv(self, path=None):
+        path = path or self.input_csv_file
+        sep = self._detect_delimiter(path)
+        df = pd.read_csv(path, dtype=str, sep=sep).fillna("")
         # Normalize headers
         clean_cols = {}
         for c in df.columns:
@@ -581,7 +708,7 @@ class MaracasProV4:
             el_id = self.get_element_id(field)
             if not el_id:
                 # Log warning if element ID not found but text exists
-                self.enqueue_log(f"⚠️ Warning: No element ID found for '{field}', skipping...")
+                self._warn_once(f"⚠️ Warning: No element ID found for '{field}', skipping...")
                 continue
 
             # HTML Check
@@ -616,8 +743,8 @@ class MaracasProV4:
 
         # Warn if element_texts is empty (no metadata will be uploaded)
         if len(element_texts) == 0:
-            self.enqueue_log("⚠️ WARNING: No metadata fields will be uploaded (element_texts is empty).")
-            self.enqueue_log("⚠️ Make sure you've fetched Element IDs in the Setup tab!")
+            self._warn_once("⚠️ WARNING: No metadata fields will be uploaded (element_texts is empty).")
+            self._warn_once("⚠️ Make sure you've fetched Element IDs in the Setup tab!")
         
         # Build payload according to Omeka Classic API specification
         # CRITICAL: Never include "id" field in POST requests
@@ -658,10 +785,27 @@ class MaracasProV4:
             self.notebook.select(0)  # Switch to Setup tab
             return
 
+        if not self._claim_run("An upload"): return
+        threading.Thread(target=self._run_upload, daemon=True).start()
+
+    def _claim_run(self, name):
+        """
+        Upload, replay, verify and watch share stats, cancel and quota state, so only one may run.
+        Call from the Tk thread; returns False (after telling the user) if something is already running.
+        """
+        if self._running:
+            messagebox.showwarning("Busy", f"{self._running} is already running. Wait for it to finish or cancel it first.")
+            return False
+        self._running = name
         self.cancel_requested = False
         self.upload_btn.config(state="disabled")
         self.cancel_btn.config(state="normal")
-        threading.Thread(target=self._run_upload, daemon=True).start()
+        return True
+
+    def _release_run(self):
+        self._running = None
+        self._ui(self.upload_btn.config, state="normal")
+        self._ui(self.cancel_btn.config, state="disabled")
 
     def request_cancel(self):
         self.cancel_requested = True
@@ -688,6 +832,7 @@ class MaracasProV4:
 
     def _run_single_test(self):
         try:
+            self._warned = set()
             df = self._read_csv()
             if df.empty: return self.enqueue_log("CSV Empty")
             
@@ -739,66 +884,943 @@ class MaracasProV4:
             data = df.to_dict(orient="records")
             limit = self.upload_limit.get()
             if limit > 0: data = data[:limit]
-            
-            total = len(data)
+            self._upload_rows(data)
+        except Exception as e:
+            self.enqueue_log(f"🔥 Critical Error: {e}")
+        finally:
+            self._release_run()
+
+    def _upload_rows(self, data, results=None):
+        """Upload (or compile, in dry-run) CSV row dicts. Shared by the Upload tab and the watch folder."""
+        total = len(data)
+        self._ui(self.upload_total_label.config, text=f"Total: {total}")
+        self.stats = {"upload_success": 0, "upload_failed": 0, "attach_failed": 0}
+        self._warned = set()
+        self._quota = None
+        self._ui(self.upload_progress.configure, value=0)
+
+        # Plan before anything is sent so cycles are reported up front (dry-run included)
+        plan = self._plan_relation_levels(data) if self.link_relations.get() else None
+        # Derivatives are local files: compiled payloads keep the source URLs so they replay anywhere
+        self._derivatives = self._prepare_derivatives(data) if self.optimize_images.get() and not self.dry_run.get() else {}
+
+        if self.dry_run.get():
+            if self.optimize_images.get():
+                self.enqueue_log("ℹ️ Image optimization is skipped in dry-run; compiled payloads keep the original file URLs.")
+            if plan:
+                self.enqueue_log("⚠️ Relation linking is not stored in compiled payloads: a replay uploads Relation values "
+                                 "as plain text and ignores row order. Upload from the CSV to link rows.")
+            return self._compile_payloads(data, results=results)
+
+        delay = self.req_delay_ms.get() / 1000.0
+        # CRITICAL: POST to /api/items (NOT /api/items/site or /api/items/{id})
+        url = self.get_api_url("items")
+        self._start_schedule()
+        
+        self.enqueue_log(f"🚀 Starting Batch: {total} items")
+        self.enqueue_log(f"📍 POST endpoint: {url}")
+
+        manifest_path = self._manifest_path()
+        with gzip.open(manifest_path, "xt", encoding="utf-8") as manifest:
+            if plan:
+                self._upload_linked(url, data, plan, delay=delay, results=results, manifest=manifest)
+            else:
+                jobs = (self._make_job(i, row) for i, row in enumerate(data))
+                self._upload_scheduled(url, jobs, total, delay=delay, results=results, manifest=manifest)
+
+        self.enqueue_log(f"🏁 Batch Complete: {self.stats['upload_success']} created, {self.stats['upload_failed']} failed"
+                         f", {self.stats['attach_failed']} file attachments failed.")
+        self._after_manifest(manifest_path)
+
+    def _update_progress(self, done, total):
+        self._ui(self.upload_success_label.config, text=f"Success: {self.stats['upload_success']}")
+        self._ui(self.upload_failed_label.config, text=f"Failed: {self.stats['upload_failed']}")
+        self._ui(self.upload_progress.configure, value=(done/total)*100 if total else 100)
+        if self._quota: self._ui(self.eta_label.config, text=self._projected_completion(done, total))
+
+    def _post_item(self, url, payload):
+        """POST one payload. Returns (ok, item_id, detail) and never raises."""
+        try:
+            r = self.session.post(url, json=payload, params={"key": self.omeka_api_key.get()}, timeout=30)
+        except Exception as e:
+            return False, None, f"Exception - {e}"
+        if r.status_code != 201:
+            return False, None, f"Failed (HTTP {r.status_code})\n   Response: {r.text[:200]}"
+        try:
+            return True, r.json().get("id"), ""
+        except Exception:
+            return True, None, ""
+
+    # ---------------------------- Compile & Replay ----------------------------
+    def _unique_output_path(self, prefix, suffix):
+        """<output>/<prefix>_<date>_<time>_<ns><suffix>; watch-folder runs can start within the same second."""
+        stamp = f"{time.strftime('%Y%m%d_%H%M%S')}_{time.time_ns() % 1_000_000_000:09d}"
+        return Path(self.output_dir_var.get()) / f"{prefix}_{stamp}{suffix}"
+
+    def _compile_payloads(self, data, results=None):
+        """Dry-run: build every payload (no sleeping, no API calls) into a gzipped NDJSON file for later replay."""
+        total = len(data)
+        out = self._unique_output_path("maracas_payloads", ".ndjson.gz")
+        self.enqueue_log(f"🧪 Dry Run: compiling {total} payloads → {out}")
+        written = 0
+        with gzip.open(out, "xt", encoding="utf-8") as f:
+            for i, row in enumerate(data):
+                if self.cancel_requested: break
+                f.write(json.dumps(self._make_job(i, row), ensure_ascii=False) + "\n")
+                written += 1
+                self.stats["upload_success"] += 1
+                if results is not None: results.append({"row": i + 1, "status": "compiled", "item_id": "", "detail": out.name})
+                # Per-row UI updates would dominate the run time; refresh in blocks
+                if written % 500 == 0 or written == total:
+                    self._update_progress(written, total)
+                    self.enqueue_log(f"   Compiled {written}/{total}")
+        self._update_progress(written, total)
+        self.enqueue_log(f"🏁 Dry Run Complete: {written} payloads written to {out}")
+        return out
+
+    def _iter_payload_file(self, path):
+        opener = gzip.open if str(path).endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line: yield json.loads(line)
+
+    def replay_payload_file(self):
+        path = filedialog.askopenfilename(filetypes=[("Compiled payloads", "*.ndjson.gz *.ndjson"), ("All files", "*.*")])
+        if not path: return
+        if not self.omeka_api_key.get().strip():
+            messagebox.showerror("Error", "Please enter your API key in the Setup tab first.")
+            return
+        if not self._claim_run("A replay"): return
+        threading.Thread(target=self._run_replay, args=(path,), daemon=True).start()
+
+    def _run_replay(self, path):
+        try:
+            # Cheap first pass so the progress bar has a total; payloads are streamed on the second
+            total = sum(1 for _ in self._iter_payload_file(path))
             self._ui(self.upload_total_label.config, text=f"Total: {total}")
-            self.stats = {"upload_success": 0, "upload_failed": 0}
+            self.stats = {"upload_success": 0, "upload_failed": 0, "attach_failed": 0}
             self._ui(self.upload_progress.configure, value=0)
 
-            delay = self.req_delay_ms.get() / 1000.0
-            # CRITICAL: POST to /api/items (NOT /api/items/site or /api/items/{id})
             url = self.get_api_url("items")
-            
-            self.enqueue_log(f"🚀 Starting Batch: {total} items")
+            self._start_schedule()
+            self.enqueue_log(f"♻️ Replaying {total} payloads from {os.path.basename(path)}")
             self.enqueue_log(f"📍 POST endpoint: {url}")
+            manifest_path = self._manifest_path()
+            with gzip.open(manifest_path, "xt", encoding="utf-8") as manifest:
+                self._upload_scheduled(url, self._iter_payload_file(path), total, manifest=manifest)
+            self.enqueue_log(f"🏁 Replay Complete: {self.stats['upload_success']} created, {self.stats['upload_failed']} failed"
+                             f", {self.stats['attach_failed']} file attachments failed.")
+            self._after_manifest(manifest_path)
+        except Exception as e:
+            self.enqueue_log(f"🔥 Critical Error: {e}")
+        finally:
+            self._release_run()
+
+    # ---------------------------- Image Derivatives ----------------------------
+    def _make_job(self, i, row):
+        """
+        Scheduler job for CSV row i. Image URLs with a prepared derivative move from file_urls to
+        "files" as {"path", "url"}, keeping the source URL in case the derivative is missing later.
+        """
+        payload = self.prepare_item_payload(row)
+        job = {"row": i + 1, "payload": payload}
+        urls = payload.get("file_urls") or []
+        files = [{"path": self._derivatives[u], "url": u} for u in urls if u in self._derivatives]
+        if files:
+            rest = [u for u in urls if u not in self._derivatives]
+            if rest: payload["file_urls"] = rest
+            else: del payload["file_urls"]
+            job["files"] = files
+        return job
+
+    def _prepare_derivatives(self, data):
+        """
+        Download every image in the Files columns and build a downscaled, metadata-free JPEG for it.
+
+        Derivatives are cached under <output>/maracas_derivatives by source content hash (plus size and
+        quality), with a URL index so re-runs skip the download. Returns {url: derivative path}; URLs
+        that fail keep going to Omeka as plain file_urls.
+        """
+        if Image is None:
+            self.enqueue_log("⚠️ Image optimization needs Pillow (pip install Pillow); sending original file URLs.")
+            return {}
+        urls = {}  # Ordered set
+        for row in data:
+            raw = row.get("Files (if available)") or row.get("Files")
+            for part in re.split(r'[;|]', str(raw or "")):
+                part = part.strip()
+                if part.startswith("http") and urlparse(part).path.lower().endswith(IMAGE_EXTENSIONS):
+                    urls[part] = None
+        if not urls: return {}
+
+        max_px, quality = max(1, self.image_max_px.get()), min(95, max(1, self.image_quality.get()))
+        cache = Path(self.output_dir_var.get()) / "maracas_derivatives"
+        (cache / "src").mkdir(parents=True, exist_ok=True)
+        index_path = cache / "index.json"
+        try: index = json.loads(index_path.read_text(encoding="utf-8")) if index_path.exists() else {}
+        except Exception: index = {}
+
+        def target(digest): return cache / f"{digest}_{max_px}_q{quality}.jpg"
+        result, todo = {}, []
+        for u in urls:
+            if u in index and target(index[u]).exists(): result[u] = str(target(index[u]))
+            else: todo.append(u)
+        self.enqueue_log(f"🖼️ Image derivatives: {len(urls)} images, {len(result)} cached, {len(todo)} to process "
+                         f"(≤{max_px}px, JPEG q{quality}, {os.cpu_count() or 1} processes)")
+
+        def download(u):
+            # Stream to disk while hashing; 200 MB scans should never sit in memory
+            h = hashlib.sha256()
+            tmp = cache / "src" / f"{threading.get_ident()}_{time.time_ns()}.part"
+            try:
+                with self.session.get(u, stream=True, timeout=60) as r:
+                    r.raise_for_status()
+                    with open(tmp, "wb") as f:
+                        for chunk in r.iter_content(1024 * 1024):
+                            if self.cancel_requested: raise RuntimeError("cancelled")
+                            h.update(chunk); f.write(chunk)
+            except Exception:
+                tmp.unlink(missing_ok=True)
+                raise
+            return h.hexdigest(), tmp
+
+        before = after = failed = 0
+        # At most `cap` scans are downloading or waiting for a process at once, so downloads run
+        # only as fast as derivatives are made and each source is deleted as soon as it is used.
+        cap = 2 * (os.cpu_count() or 1)
+        pending = deque(todo)
+        active = {}  # future -> (url, source temp file, derivative path); source is None while downloading
+        with ProcessPoolExecutor() as cpu, ThreadPoolExecutor(max_workers=max(1, self.upload_workers.get())) as io:
+            while pending or active:
+                while pending and len(active) < cap and not self.cancel_requested:
+                    u = pending.popleft()
+                    active[io.submit(download, u)] = (u, None, None)
+                if not active: break
+                finished, _ = wait(active, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    u, tmp, dst = active.pop(fut)
+                    if tmp is None:  # Download finished
+                        try: digest, tmp = fut.result()
+                        except Exception as e:
+                            if not self.cancel_requested:
+                                failed += 1; self.enqueue_log(f"⚠️ Could not download {u}: {e}")
+                            continue
+                        index[u] = digest
+                        dst = target(digest)
+                        if dst.exists() or self.cancel_requested:
+                            tmp.unlink(missing_ok=True)
+                            if dst.exists(): result[u] = str(dst)  # Same content already derived under another URL
+                            continue
+                        active[cpu.submit(_make_derivative, str(tmp), str(dst), max_px, quality)] = (u, tmp, dst)
+                        continue
+                    try:
+                        src_size, dst_size = fut.result()
+                        before += src_size; after += dst_size; result[u] = str(dst)
+                    except Exception as e:
+                        failed += 1; index.pop(u, None); self.enqueue_log(f"⚠️ Could not process {u}: {e}")
+                    finally:
+                        tmp.unlink(missing_ok=True)
+
+        index_path.write_text(json.dumps(index, indent=2), encoding="utf-8")
+        if before:
+            self.enqueue_log(f"🖼️ Reduced {before / 1048576:.1f} MB → {after / 1048576:.1f} MB")
+        self.enqueue_log(f"🖼️ {len(result)} derivatives ready" + (f", {failed} failed (sent as URLs)" if failed else ""))
+        return result
+
+    # ---------------------------- Scheduler ----------------------------
+    def _attach_files(self, item_id, file_urls):
+        """Attach file_urls to an existing item. Returns (ok, detail) and never raises."""
+        try:
+            r = self.session.put(self.get_api_url(f"items/{item_id}"), json={"file_urls": file_urls},
+                                 params={"key": self.omeka_api_key.get()}, timeout=300)
+        except Exception as e:
+            return False, f"Exception - {e}"
+        if r.status_code != 200:
+            return False, f"HTTP {r.status_code}: {r.text[:200]}"
+        return True, ""
 
-            for i, row in enumerate(data):
-                if self.cancel_requested: break
-                
-                payload = self.prepare_item_payload(row)
-                
-                if not self.dry_run.get():
+    def _upload_file(self, item_id, path):
+        """Upload a local file to an existing item via /api/files. Returns (ok, detail) and never raises."""
+        try:
+            with open(path, "rb") as fh:
+                r = self.session.post(self.get_api_url("files"), params={"key": self.omeka_api_key.get()},
+                                      data={"data": json.dumps({"item": {"id": item_id}})},
+                                      files={"file": (os.path.basename(path), fh)}, timeout=300)
+        except Exception as e:
+            return False, f"Exception - {e}"
+        if r.status_code != 201:
+            return False, f"HTTP {r.status_code}: {r.text[:200]}"
+        return True, ""
+
+    def _upload_scheduled(self, url, jobs, total, delay=0.0, results=None, manifest=None, on_result=None):
+        """
+        Upload {"row", "payload"[, "files"]} jobs through two lanes with their own concurrency limits.
+        "files" are {"path", "url"} image derivatives uploaded to /api/files once the item exists.
+
+        Rows carrying file_urls make Omeka download attachments inside the POST, so they go to
+        the file lane and cannot hold up the metadata lane. With 'Attach files after create'
+        every item is created in the metadata lane and its files are attached by the file lane.
+        Per-row outcomes are appended to `results` when given and reported to `on_result(row, ok, item_id)`.
+        Each created item is written to `manifest` (an open NDJSON text file) with the payload sent for it.
+        A {"row", "skip": reason} job is recorded as failed without sending anything.
+        """
+        meta_n = max(1, self.upload_workers.get())
+        file_n = max(1, self.file_workers.get())
+        defer = self.defer_file_attach.get()
+        self.enqueue_log(f"🛣️ Lanes: {meta_n} metadata / {file_n} file workers"
+                         + (" (files attached after create)" if defer else ""))
+
+        lock = threading.Lock()
+        done = 0
+        last_refresh = time.time()
+        # The producer only ever waits on the metadata lane. File-lane jobs are parked in
+        # `backlog` (just the job dicts, which the CSV has in memory anyway) and a feeder
+        # thread hands them to the file pool as its slots free up, so a slow file lane
+        # never holds up metadata rows. Deferred attaches share the same file slots.
+        meta_slots = threading.BoundedSemaphore(meta_n * 2)
+        file_slots = threading.BoundedSemaphore(file_n * 2)
+        backlog, backlog_cv = deque(), threading.Condition()
+        producing = True
+
+        def record(row, ok, item_id, detail, payload, files):
+            nonlocal done, last_refresh
+            with lock:
+                done += 1
+                if ok and item_id and manifest is not None:
                     try:
-                        r = self.session.post(
-                            url, 
-                            json=payload, 
-                            params={"key": self.omeka_api_key.get()},
-                            timeout=30
-                        )
-                        
-                        if r.status_code == 201:
-                            self.stats["upload_success"] += 1
-                            try:
-                                response_data = r.json()
-                                item_id = response_data.get("id")
-                                self.enqueue_log(f"✅ Item {i+1}/{total}: Created (ID {item_id})")
-                            except Exception:
-                                self.enqueue_log(f"✅ Item {i+1}/{total}: Created (Status 201)")
-                        else:
-                            self.stats["upload_failed"] += 1
-                            self.enqueue_log(f"❌ Item {i+1}/{total}: Failed (HTTP {r.status_code})")
-                            self.enqueue_log(f"   Response: {r.text[:200]}")
+                        manifest.write(json.dumps({"row": row, "item_id": item_id, "payload": payload,
+                                                   "files": len(files or ())}, ensure_ascii=False) + "\n")
                     except Exception as e:
-                        self.stats["upload_failed"] += 1
-                        self.enqueue_log(f"❌ Item {i+1}/{total}: Exception - {str(e)}")
+                        self._warn_once(f"⚠️ Could not write the sent manifest ({e}); it will be incomplete")
+                if results is not None:
+                    results.append({"row": row, "status": "created" if ok else "failed", "item_id": item_id or "", "detail": detail})
+                if ok: self.stats["upload_success"] += 1
                 else:
-                    self.stats["upload_success"] += 1
-                    self.enqueue_log(f"✅ Item {i+1}/{total}: Dry run OK")
+                    self.stats["upload_failed"] += 1
+                    self.enqueue_log(f"❌ Row {row}: {detail}")
+                if done % 100 == 0 or done == total:
+                    self.enqueue_log(f"   {done}/{total} sent")
+                # Throttled runs can take minutes per 100 rows; keep progress and ETA moving
+                if done % 100 == 0 or done == total or time.time() - last_refresh >= 2:
+                    last_refresh = time.time()
+                    self._update_progress(done, total)
+                if on_result: on_result(row, ok, item_id)
+
+        def attach(row, item_id, file_urls, files, slot=None):
+            try:
+                failures, local = [], []
+                for f in files or ():
+                    if os.path.exists(f["path"]): local.append(f["path"])
+                    # Derivative not on this machine (e.g. replayed elsewhere): let Omeka fetch the original
+                    else: file_urls = list(file_urls or []) + [f["url"]]
+                if file_urls:
+                    if not self._quota_gate(len(json.dumps(file_urls).encode("utf-8")), items=0): return
+                    ok, detail = self._attach_files(item_id, file_urls)
+                    if not ok: failures.append(detail)
+                for path in local:
+                    if not self._quota_gate(os.path.getsize(path), items=0): return
+                    ok, detail = self._upload_file(item_id, path)
+                    if not ok: failures.append(f"{os.path.basename(path)}: {detail}")
+                if failures:
+                    detail = "; ".join(failures)
+                    with lock:
+                        self.stats["attach_failed"] += 1
+                        if results is not None:
+                            results.append({"row": row, "status": "attach_failed", "item_id": item_id, "detail": detail})
+                    self.enqueue_log(f"⚠️ Row {row}: Item {item_id} created but files failed to attach ({detail})")
+            except Exception as e:
+                with lock:
+                    self.stats["attach_failed"] += 1
+                    if results is not None:
+                        results.append({"row": row, "status": "attach_failed", "item_id": item_id, "detail": f"Exception - {e}"})
+                self.enqueue_log(f"⚠️ Row {row}: Item {item_id} created but attaching files raised: {e}")
+            finally:
+                if slot: slot.release()
+
+        def create(row, payload, files, slot):
+            recorded = False
+            try:
+                if self.cancel_requested: return
+                sent = payload  # As built, including file_urls attached later
+                file_urls = payload.get("file_urls") if defer else None
+                if file_urls:
+                    payload = {k: v for k, v in payload.items() if k != "file_urls"}
+                if not self._quota_gate(len(json.dumps(payload).encode("utf-8"))): return
+                ok, item_id, detail = self._post_item(url, payload)
+                record(row, ok, item_id, detail, sent, files)
+                recorded = True
+                if ok and (file_urls or files):
+                    if not item_id: self.enqueue_log(f"⚠️ Row {row}: Created without an ID in the response; files not attached")
+                    elif defer:
+                        file_slots.acquire()  # Bounded like file-lane rows; waits only this metadata worker
+                        file_pool.submit(attach, row, item_id, file_urls, files, file_slots)
+                    else: attach(row, item_id, None, files)  # Already running in the file lane
+                if delay: time.sleep(delay)
+            except Exception as e:
+                # Always record the row once, so linked rows waiting on it are released or skipped
+                if not recorded: record(row, False, None, f"Exception - {e}", None, None)
+                else: self.enqueue_log(f"⚠️ Row {row}: {e}")
+            finally:
+                slot.release()
+
+        def feed_file_lane():
+            while True:
+                with backlog_cv:
+                    while not backlog and producing: backlog_cv.wait()
+                    if not backlog or self.cancel_requested: return
+                    job = backlog.popleft()
+                file_slots.acquire()
+                file_pool.submit(create, job.get("row"), job["payload"], job.get("files"), file_slots)
+
+        with ThreadPoolExecutor(max_workers=file_n) as file_pool:
+            feeder = threading.Thread(target=feed_file_lane, daemon=True)
+            feeder.start()
+            with ThreadPoolExecutor(max_workers=meta_n) as meta_pool:
+                try:
+                    for job in jobs:
+                        if self.cancel_requested: break
+                        if "skip" in job:
+                            record(job["row"], False, None, job["skip"], None, None)
+                            continue
+                        payload, files = job["payload"], job.get("files")
+                        if (payload.get("file_urls") or files) and not defer:
+                            with backlog_cv:
+                                backlog.append(job)
+                                backlog_cv.notify()
+                        else:
+                            meta_slots.acquire()
+                            meta_pool.submit(create, job.get("row"), payload, files, meta_slots)
+                finally:
+                    with backlog_cv:
+                        producing = False
+                        backlog_cv.notify()
+                feeder.join()
+        self._update_progress(done, total)
+
+    # ---------------------------- Verification ----------------------------
+    def _manifest_path(self):
+        return self._unique_output_path("maracas_sent", ".ndjson.gz")
+
+    def _after_manifest(self, path):
+        self.enqueue_log(f"🧾 Sent manifest: {path}")
+        if self.verify_after_upload.get() and not self.cancel_requested:
+            self._verify_manifest(path)
+
+    def verify_manifest_file(self):
+        path = filedialog.askopenfilename(filetypes=[("Sent manifests", "maracas_sent_*.ndjson.gz"), ("All files", "*.*")])
+        if not path: return
+        if not self._claim_run("A verification"): return
+        threading.Thread(target=self._run_verify, args=(path,), daemon=True).start()
+
+    def _run_verify(self, path):
+        try:
+            self._quota = None
+            self._start_schedule()
+            self._verify_manifest(path)
+        except Exception as e:
+            self.enqueue_log(f"🔥 Critical Error: {e}")
+        finally:
+            self._release_run()
 
-                # UI Update
-                self._ui(self.upload_success_label.config, text=f"Success: {self.stats['upload_success']}")
-                self._ui(self.upload_failed_label.config, text=f"Failed: {self.stats['upload_failed']}")
-                self._ui(self.upload_progress.configure, value=((i+1)/total)*100)
-                
-                time.sleep(delay)
+    def _fetch_item(self, item_id):
+        """GET /api/items/{id}. Returns (item dict or None, error) and never raises."""
+        try:
+            r = self.session.get(self.get_api_url(f"items/{item_id}"), params={"key": self.omeka_api_key.get()}, timeout=30)
+        except Exception as e:
+            return None, f"Exception - {e}"
+        if r.status_code != 200:
+            return None, f"HTTP {r.status_code}: {r.text[:200]}"
+        try:
+            return r.json(), ""
+        except Exception as e:
+            return None, f"Invalid JSON - {e}"
+
+    def _compare_item(self, entry, item):
+        """Discrepancies between a manifest entry (what was sent) and the item Omeka returned."""
+        def norm(t): return re.sub(r'\s+', " ", str(t or "")).strip()
+        payload, issues = entry["payload"], []
+
+        actual = {}
+        for et in item.get("element_texts") or []:
+            actual.setdefault((et.get("element") or {}).get("id"), []).append(norm(et.get("text")))
+        for et in payload.get("element_texts") or []:
+            eid = et["element"]["id"]
+            if norm(et["text"]) not in actual.get(eid, []):
+                got = " | ".join(actual.get(eid, [])) or "(missing)"
+                issues.append(("element_text", f"element {eid}: {et['text'][:200]}", got[:200]))
+
+        sent_tags = {t["name"].strip() for t in payload.get("tags") or []}
+        got_tags = {(t.get("name") or "").strip() for t in item.get("tags") or []}
+        if sent_tags - got_tags:
+            issues.append(("tags", "; ".join(sorted(sent_tags - got_tags)), "; ".join(sorted(got_tags)) or "(none)"))
+
+        want_files = len(payload.get("file_urls") or []) + int(entry.get("files") or 0)
+        files = item.get("files")
+        got_files = files.get("count", 0) if isinstance(files, dict) else len(files or [])
+        if got_files < want_files:
+            issues.append(("files", str(want_files), str(got_files)))
+
+        if "public" in payload and "public" in item and bool(item["public"]) != bool(payload["public"]):
+            issues.append(("public", str(payload["public"]), str(item.get("public"))))
+        return issues
+
+    def _verify_manifest(self, path):
+        """
+        Read back created items concurrently (all, or a random sample) and compare them with the payloads
+        that were sent. Writes maracas_verify_<ts>.csv when anything differs; nothing is re-uploaded.
+        """
+        pct = min(100, max(1, self.verify_sample_pct.get()))
+        entries = sum(1 for _ in self._iter_payload_file(path))
+        self.enqueue_log(f"🔍 Verifying {'all' if pct == 100 else f'~{pct}% of'} {entries} items from {os.path.basename(str(path))}")
+        if not entries: return
+
+        def check(entry):
+            if not self._quota_gate(0, items=0): return entry, None, None  # Cancelled; reads don't use the items budget
+            item, error = self._fetch_item(entry["item_id"])
+            return entry, item, error
+
+        workers = max(1, self.upload_workers.get())
+        report = self._unique_output_path("maracas_verify", ".csv")
+        checked = bad = seen = 0
+        pending = set()
+        with open(report, "x", encoding="utf-8", newline="") as f, ThreadPoolExecutor(max_workers=workers) as pool:
+            w = csv.writer(f)
+            w.writerow(["row", "item_id", "check", "expected", "actual"])
+
+            def collect(finished):
+                nonlocal checked, bad
+                for fut in finished:
+                    pending.discard(fut)
+                    entry, item, error = fut.result()
+                    if item is None and error is None: continue
+                    issues = [("fetch", "HTTP 200", error)] if item is None else self._compare_item(entry, item)
+                    checked += 1
+                    if issues:
+                        bad += 1
+                        for check_name, expected, actual in issues:
+                            w.writerow([entry.get("row"), entry["item_id"], check_name, expected, actual])
+                    if checked % 100 == 0:
+                        self.enqueue_log(f"   Verified {checked} items ({bad} with discrepancies)")
+
+            for entry in self._iter_payload_file(path):
+                if self.cancel_requested: break
+                seen += 1
+                if pct < 100 and random.random() * 100 >= pct: continue
+                pending.add(pool.submit(check, entry))
+                if len(pending) >= workers * 2:
+                    collect(wait(list(pending), return_when=FIRST_COMPLETED)[0])
+                if seen % 500 == 0:  # Refresh in blocks; per-entry UI callbacks would flood Tk
+                    self._ui(self.upload_progress.configure, value=(seen / entries) * 100)
+            collect(wait(list(pending))[0])
+        self._ui(self.upload_progress.configure, value=100)
+
+        if bad:
+            self.enqueue_log(f"⚠️ Verification: {bad} of {checked} items differ from what was sent → {report}")
+        else:
+            report.unlink(missing_ok=True)
+            self.enqueue_log(f"✅ Verification: all {checked} checked items match what was sent.")
+
+    # ---------------------------- Schedule & Quotas ----------------------------
+    def _parse_windows(self, text):
+        """Parse "22:00-06:00, 12:00-13:00" into [(start_min, end_min), ...]. Windows may cross midnight."""
+        windows = []
+        for part in re.split(r'[,;]', text):
+            if not part.strip(): continue
+            m = re.fullmatch(r'\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*', part)
+            if not m: raise ValueError(f"Invalid upload window '{part.strip()}' (expected HH:MM-HH:MM)")
+            h1, m1, h2, m2 = map(int, m.groups())
+            # 24:00 (end of day) is the only valid time with hour 24
+            if any(h > 24 or mi > 59 or (h == 24 and mi) for h, mi in ((h1, m1), (h2, m2))):
+                raise ValueError(f"Invalid time in upload window '{part.strip()}'")
+            windows.append((h1 * 60 + m1, h2 * 60 + m2))
+        return windows
+
+    def _window_state(self, windows, t):
+        """Return (inside, when) — whether time t is inside an allowed window and when that next changes."""
+        lt = time.localtime(t)
+        midnight = t - (lt.tm_hour * 3600 + lt.tm_min * 60 + lt.tm_sec)
+        spans = []
+        for day in (-1, 0, 1):
+            for start, end in windows:
+                s = midnight + day * 86400 + start * 60
+                e = midnight + day * 86400 + end * 60 + (86400 if end <= start else 0)
+                spans.append((s, e))
+        inside = [e for s, e in spans if s <= t < e]
+        if inside: return True, max(inside)
+        return False, min(s for s, e in spans if s > t)
+
+    def _start_schedule(self):
+        """Reset per-run throughput tracking; windows/budgets only apply when scheduling is enabled."""
+        enabled = self.schedule_enabled.get()
+        self._quota = {
+            "lock": threading.Lock(),
+            "windows": self._parse_windows(self.schedule_windows.get()) if enabled else [],
+            "items_per_hour": max(0, self.items_per_hour.get()) if enabled else 0,
+            "bytes_per_hour": max(0, self.mb_per_hour.get()) * 1024 * 1024 if enabled else 0,
+            "sent": deque(), "bytes_in_hour": 0, "items_in_hour": 0,  # (timestamp, bytes, items) for the sliding hour
+            "started": time.time(), "paused_since": None, "paused_total": 0.0,
+        }
+        if enabled:
+            q = self._quota
+            self.enqueue_log(f"🕒 Schedule: windows {self.schedule_windows.get().strip() or 'any time'}"
+                             f", {q['items_per_hour'] or '∞'} items/hour, {self.mb_per_hour.get() or '∞'} MB/hour")
+
+    def _quota_gate(self, nbytes, items=1):
+        """
+        Block the calling worker until a request of `nbytes` fits the window and hourly budgets.
+        `items` is how many items the request creates (0 for attachments and verification reads),
+        so only item creation counts toward items/hour. Returns False if the run was cancelled
+        while waiting. Workers simply wait in place, so the batch resumes exactly where it paused.
+        """
+        q = self._quota
+        if not q or not (q["windows"] or q["items_per_hour"] or q["bytes_per_hour"]):
+            return not self.cancel_requested
+        while not self.cancel_requested:
+            with q["lock"]:
+                now = time.time()
+                sent = q["sent"]
+                while sent and now - sent[0][0] >= 3600:
+                    _, old_bytes, old_items = sent.popleft()
+                    q["bytes_in_hour"] -= old_bytes
+                    q["items_in_hour"] -= old_items
+                inside, change = self._window_state(q["windows"], now) if q["windows"] else (True, None)
+                if not inside:
+                    wait_until, reason = change, "outside upload window"
+                elif items and q["items_per_hour"] and q["items_in_hour"] + items > q["items_per_hour"]:
+                    wait_until, reason = sent[0][0] + 3600, "items/hour budget reached"
+                elif q["bytes_per_hour"] and sent and q["bytes_in_hour"] + nbytes > q["bytes_per_hour"]:
+                    wait_until, reason = sent[0][0] + 3600, "MB/hour budget reached"
+                else:
+                    if nbytes or items:
+                        sent.append((now, nbytes, items))
+                        q["bytes_in_hour"] += nbytes
+                        q["items_in_hour"] += items
+                    if q["paused_since"] is not None:
+                        q["paused_total"] += now - q["paused_since"]
+                        q["paused_since"] = None
+                        self.enqueue_log("▶️ Resumed upload")
+                    return True
+                if q["paused_since"] is None:
+                    q["paused_since"] = now
+                    self.enqueue_log(f"⏸️ Paused ({reason}) until {time.strftime('%a %H:%M', time.localtime(wait_until))}")
+            time.sleep(max(0.05, min(1.0, wait_until - time.time())))
+        return False
+
+    def _projected_completion(self, done, total):
+        """ETA text from observed throughput (paused time excluded), capped by budgets and mapped onto the windows."""
+        q = self._quota
+        now = time.time()
+        paused = q["paused_total"] + (now - q["paused_since"] if q["paused_since"] is not None else 0)
+        active = now - q["started"] - paused
+        remaining = total - done
+        if remaining <= 0: return "ETA: done"
+        if done <= 0 or active <= 1: return "ETA: measuring..."
+        rate = done / active  # items per active second
+        if q["items_per_hour"]: rate = min(rate, q["items_per_hour"] / 3600.0)
+        if q["bytes_per_hour"] and q["items_in_hour"]:
+            avg_bytes = max(1.0, q["bytes_in_hour"] / q["items_in_hour"])  # Per item, attachments included
+            rate = min(rate, q["bytes_per_hour"] / avg_bytes / 3600.0)
+        need, t = remaining / rate, now
+        if q["windows"]:
+            for _ in range(1000):  # Bounded walk over window boundaries
+                inside, change = self._window_state(q["windows"], t)
+                if inside:
+                    step = min(need, change - t); need -= step; t += step
+                    if need <= 0: break
+                else:
+                    t = change
+        else:
+            t += need
+        return f"ETA: {time.strftime('%a %d %b %H:%M', time.localtime(t))} ({rate * 3600:.0f} items/h)"
+
+    # ---------------------------- Relation Linking ----------------------------
+    RELATION_COLUMNS = ("Relation", "Relation (EN)", "Relation (ES)")
+    IDENTIFIER_COLUMNS = ("Identifier", "Identifier (EN)", "Identifier (ES)")
+
+    def _plan_relation_levels(self, data):
+        """
+        Build the Relation → Identifier graph for the batch.
+
+        Returns {"depth": longest reference chain, "deps": {index: {index, ...}}, "ids": {identifier: index}}.
+        Raises ValueError if references form a cycle.
+        """
+        ids = {}
+        for i, row in enumerate(data):
+            for col in self.IDENTIFIER_COLUMNS:
+                ident = str(row.get(col) or "").strip()
+                if not ident: continue
+                if ident in ids and ids[ident] != i:
+                    self._warn_once(f"⚠️ Identifier '{ident}' appears on rows {ids[ident] + 1} and {i + 1}; using row {ids[ident] + 1}")
+                    continue
+                ids[ident] = i
+
+        deps = {}
+        for i, row in enumerate(data):
+            refs = {ids[part] for part in self._relation_parts(row) if part in ids}
+            refs.discard(i)
+            if refs: deps[i] = refs
+        if not deps:
+            self.enqueue_log("🔗 No Relation values reference an Identifier in this CSV.")
+            return None
+
+        # Kahn's algorithm: whatever is still waiting afterwards is in (or behind) a cycle
+        dependents = {}
+        for i, refs in deps.items():
+            for j in refs: dependents.setdefault(j, []).append(i)
+        waiting = {i: len(refs) for i, refs in deps.items()}
+        level = [i for i in range(len(data)) if i not in deps]
+        depth = 0
+        while level:
+            depth += 1
+            nxt = []
+            for j in level:
+                for i in dependents.get(j, []):
+                    waiting[i] -= 1
+                    if waiting[i] == 0: nxt.append(i)
+            level = nxt
+
+        stuck = [i for i, n in waiting.items() if n > 0]
+        if stuck:
+            for cycle in self._find_relation_cycles(stuck, deps):
+                self.enqueue_log("🔁 Relation cycle: " + " → ".join(self._row_label(data[i], i) for i in cycle + cycle[:1]))
+            raise ValueError(f"{len(stuck)} rows are part of (or depend on) Relation cycles; nothing was uploaded")
+
+        self.enqueue_log(f"🔗 {len(deps)} rows reference other rows; up to {depth} levels deep; each starts once its targets exist")
+        return {"depth": depth, "deps": deps, "ids": ids}
+
+    def _relation_parts(self, row):
+        for col in self.RELATION_COLUMNS:
+            for part in re.split(r'[;|]', str(row.get(col) or "")):
+                if part.strip(): yield part.strip()
+
+    def _find_relation_cycles(self, stuck, deps):
+        """Return one representative cycle (list of row indexes) per strongly-connected knot among `stuck`."""
+        stuck = set(stuck)
+        cycles, reported = [], set()
+        for start in sorted(stuck):
+            if start in reported: continue
+            path, on_path, node = [], {}, start
+            # Every stuck row has at least one stuck dependency, so this walk must revisit a node
+            while node not in on_path:
+                if node in reported: break
+                on_path[node] = len(path); path.append(node)
+                node = min(d for d in deps[node] if d in stuck)
+            else:
+                cycle = path[on_path[node]:]
+                cycles.append(cycle)
+            reported.update(path)
+        return cycles
+
+    def _row_label(self, row, i):
+        for col in self.IDENTIFIER_COLUMNS:
+            if str(row.get(col) or "").strip(): return f"{str(row[col]).strip()} (row {i + 1})"
+        return f"row {i + 1}"
+
+    def _item_public_url(self, item_id):
+        # The API lives at <site>/api/; items are shown at <site>/items/show/<id>
+        base = self.omeka_api_url.get().strip()
+        if not base.endswith("/"): base += "/"
+        site = base[:-4] if base.endswith("/api/") else base
+        return urljoin(site, f"items/show/{item_id}")
+
+    def _rewrite_relations(self, row, urls):
+        """Copy of `row` with Relation parts that name a created Identifier replaced by that item's URL."""
+        row = dict(row)
+        for col in self.RELATION_COLUMNS:
+            if not str(row.get(col) or "").strip(): continue
+            pieces = re.split(r'([;|])', str(row[col]))
+            row[col] = "".join(urls.get(p.strip(), p) if p not in (";", "|") else p for p in pieces)
+        return row
+
+    def _upload_linked(self, url, data, plan, delay=0.0, results=None, manifest=None):
+        """
+        Upload through the lane scheduler, releasing each referencing row as soon as every row it
+        references has an item ID. Rows whose targets failed are recorded as skipped, and so on down the graph.
+        """
+        deps = plan["deps"]
+        dependents, idents_of = {}, {}
+        for i, refs in deps.items():
+            for j in refs: dependents.setdefault(j, []).append(i)
+        for ident, i in plan["ids"].items(): idents_of.setdefault(i, []).append(ident)
+        waiting = {i: len(refs) for i, refs in deps.items()}
+        failed_refs = {}  # row index -> referenced rows that were not created
+        finished = queue.Queue()
+
+        def on_result(row, ok, item_id):
+            finished.put((row - 1, bool(ok and item_id), item_id))
+
+        def jobs():
+            urls = {}  # identifier -> created item URL; only touched on this (producer) thread
+            ready = deque(i for i in range(len(data)) if i not in deps)
+            remaining = len(data)
+            while remaining:
+                while ready:
+                    i = ready.popleft(); remaining -= 1
+                    if i in failed_refs:
+                        yield {"row": i + 1, "skip": "Skipped: referenced row(s) not created: "
+                               + ", ".join(self._row_label(data[d], d) for d in failed_refs[i])}
+                    elif i in deps:
+                        yield self._make_job(i, self._rewrite_relations(data[i], urls))
+                    else:
+                        yield self._make_job(i, data[i])
+                if not remaining or self.cancel_requested: return
+                try: j, ok, item_id = finished.get(timeout=0.5)
+                except queue.Empty: continue
+                if ok:
+                    for ident in idents_of.get(j, []): urls[ident] = self._item_public_url(item_id)
+                for i in dependents.get(j, []):
+                    if not ok: failed_refs.setdefault(i, []).append(j)
+                    waiting[i] -= 1
+                    if waiting[i] == 0: ready.append(i)
+
+        self._upload_scheduled(url, jobs(), len(data), delay=delay, results=results,
+                               manifest=manifest, on_result=on_result)
+
+    # ---------------------------- Watch Folder ----------------------------
+    def browse_watch_directory(self):
+        p = filedialog.askdirectory()
+        if p: self.watch_dir.set(p)
 
-            self.enqueue_log("🏁 Batch Complete.")
+    def toggle_watch_folder(self):
+        if self.watching:
+            self.watching = False
+            self.watch_btn.config(state="disabled")
+            self.enqueue_log("👁️ Stopping watch folder after the current file...")
+            return
+
+        folder = self.watch_dir.get().strip()
+        if not folder or not Path(folder).is_dir():
+            messagebox.showerror("Error", "Please choose an existing folder to watch.")
+            return
+        if not self.dc_elements or len(self.dc_elements) == 0:
+            messagebox.showerror(
+                "Element IDs Required",
+                "You MUST fetch Element IDs before watching a folder!\n\n"
+                "Please go to the Setup tab and click:\n"
+                "'2. Fetch Element IDs (Required)'"
+            )
+            self.notebook.select(0)  # Switch to Setup tab
+            return
+        if self.dry_run.get():
+            messagebox.showerror("Dry-run Enabled", "The watch folder uploads every file it picks up.\n\n"
+                                 "Turn off 'Dry-run' before you start watching.")
+            return
 
+        if not self._claim_run("The watch folder"): return
+        self.watching = True
+        self.watch_btn.config(text="⏹️ Stop Watching", bg="#e53e3e")
+        threading.Thread(target=self._run_watch_folder, args=(Path(folder),), daemon=True).start()
+
+    def _load_watch_queue(self, folder):
+        p = folder / ".maracas_queue.json"
+        try:
+            if p.exists(): return json.loads(p.read_text(encoding="utf-8")).get("queue", [])
         except Exception as e:
-            self.enqueue_log(f"🔥 Critical Error: {e}")
+            self.enqueue_log(f"⚠️ Could not read watch queue, starting empty: {e}")
+        return []
+
+    def _save_watch_queue(self, folder, entries):
+        p = folder / ".maracas_queue.json"
+        tmp = p.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"queue": entries}, indent=2), encoding="utf-8")
+        os.replace(tmp, p)
+
+    def _run_watch_folder(self, folder):
+        """Poll `folder` for CSVs, queue each once its size/mtime stop changing, and process them in order."""
+        for sub in ("done", "failed", "compiled"): (folder / sub).mkdir(exist_ok=True)
+        entries = self._load_watch_queue(folder)
+        # A file still marked 'processing' was interrupted mid-upload; re-running it could duplicate items
+        for entry in [e for e in entries if e.get("state") == "processing"]:
+            self.enqueue_log(f"⚠️ {entry['name']} was interrupted during a previous run; moving to failed/")
+            self._finish_watch_file(folder, entry, "failed", [], "Interrupted before completion; check Omeka for partial items")
+            entries.remove(entry)
+        self._save_watch_queue(folder, entries)
+
+        self.enqueue_log(f"👁️ Watching {folder} (reusing session and {len(self.dc_elements)} mapped element IDs)")
+        last_seen = {}
+        try:
+            while self.watching:
+                queued = {e["name"] for e in entries}
+                current = {}
+                for p in sorted(folder.glob("*.csv")):
+                    try: st = p.stat()
+                    except OSError: continue
+                    current[p.name] = (st.st_size, st.st_mtime)
+                    # Only queue once the file looked the same on two consecutive polls (copy finished)
+                    if p.name not in queued and last_seen.get(p.name) == current[p.name]:
+                        entries.append({"name": p.name, "state": "queued", "queued_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+                        self.enqueue_log(f"📥 Queued {p.name}")
+                        self._save_watch_queue(folder, entries)
+                last_seen = current
+
+                while entries and self.watching:
+                    entry = entries[0]
+                    entry["state"] = "processing"
+                    self._save_watch_queue(folder, entries)
+                    self._ui(self.watch_status.config, text=f"Processing {entry['name']} ({len(entries) - 1} waiting)", fg="#2b6cb0")
+                    self._process_watch_file(folder, entry)
+                    entries.pop(0)
+                    self._save_watch_queue(folder, entries)
+                    last_seen.pop(entry["name"], None)
+
+                self._ui(self.watch_status.config, text=f"Watching ({time.strftime('%H:%M:%S')})", fg="#38a169")
+                for _ in range(self.watch_interval_s * 10):
+                    if not self.watching: break
+                    time.sleep(0.1)
+        except Exception as e:
+            self.enqueue_log(f"🔥 Watch folder stopped: {e}")
         finally:
-            self._ui(self.upload_btn.config, state="normal")
-            self._ui(self.cancel_btn.config, state="disabled")
+            self.watching = False
+            self._ui(self.watch_status.config, text="Not watching", fg="#718096")
+            self._ui(self.watch_btn.config, text="👁️ Start Watching", bg="#319795", state="normal")
+            self._release_run()
+            self.enqueue_log("👁️ Watch folder stopped.")
+
+    def _process_watch_file(self, folder, entry):
+        path = folder / entry["name"]
+        self.enqueue_log(f"📄 Processing {entry['name']}")
+        self.cancel_requested = False
+        results = []
+        try:
+            if not path.exists():
+                raise FileNotFoundError(f"{entry['name']} disappeared before processing")
+            data = self._read_csv(str(path)).to_dict(orient="records")
+            # Dry-run may have been switched on after watching started; nothing gets uploaded then
+            compiled_only = self.dry_run.get()
+            self._upload_rows(data, results=results)
+            if self.cancel_requested:
+                outcome, note = "failed", "Cancelled"
+            elif compiled_only:
+                outcome, note = "compiled", "Dry-run: payloads compiled, nothing uploaded"
+            elif self.stats["upload_failed"] == 0 and self.stats["attach_failed"] == 0:
+                outcome, note = "done", ""
+            else:
+                outcome, note = "failed", f"{self.stats['upload_failed']} rows failed, {self.stats['attach_failed']} file attachments failed"
+        except Exception as e:
+            outcome, note = "failed", str(e)
+            self.enqueue_log(f"❌ {entry['name']}: {e}")
+        self._finish_watch_file(folder, entry, outcome, results, note)
+
+    def _finish_watch_file(self, folder, entry, outcome, results, note=""):
+        """Move the CSV to done/, failed/ or compiled/ (dry-run) and write <name>.report.csv next to it."""
+        dest_dir = folder / outcome
+        src = folder / entry["name"]
+        dest = dest_dir / entry["name"]
+        if dest.exists():
+            dest = dest_dir / f"{dest.stem}_{time.time_ns()}{dest.suffix}"
+        try:
+            if src.exists(): os.replace(src, dest)
+            report = dest.with_name(dest.stem + ".report.csv")
+            with open(report, "w", encoding="utf-8", newline="") as f:
+                w = csv.DictWriter(f, fieldnames=["row", "status", "item_id", "detail"])
+                w.writeheader()
+                if note: w.writerow({"row": "", "status": "note", "item_id": "", "detail": note})
+                w.writerows(sorted(results, key=lambda r: (r["row"] or 0)))
+            icon = {"done": "✅", "compiled": "🧪"}.get(outcome, "❌")
+            self.enqueue_log(f"{icon} {entry['name']} → {dest_dir.name}/ (report: {report.name})")
+        except Exception as e:
+            self.enqueue_log(f"❌ Could not move {entry['name']} or write its report: {e}")
 
     def clear_upload_log(self):
         self.upload_log.delete(1.0, tk.END)